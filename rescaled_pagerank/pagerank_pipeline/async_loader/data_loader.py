@@ -4,6 +4,8 @@ import io
 import aioboto3
 import awswrangler as wr
 import polars as pl
+import polars.selectors as cs
+from botocore.config import Config
 from tqdm import tqdm
 
 
@@ -16,15 +18,26 @@ class AsyncS3DataLoader:
         chunks: int - Number of chunks to process the data in
         polars_args: function/method - list of arguments to passed to polars read
         tqdm_desc: str - Description to be shown in tqdm progress bar
+        max_concurrency: int - Maximum number of s3 reads in flight at once
     """
 
-    def __init__(self, bucket_name, prefix, chunks, polars_args=None, tqdm_desc=''):
+    def __init__(
+        self,
+        bucket_name,
+        prefix,
+        chunks,
+        polars_args=None,
+        tqdm_desc='',
+        max_concurrency=64,
+    ):
         """Initialises asynchronous s3 data loader
         Args:
             bucket_name: str - Name of the s3 bucket
             prefix: str - AWS prefix of file location
             chunks: int - Number of chunks to process the data in
             polars_args: function/method - list of arguments to passed to polars read
+            max_concurrency: int - Maximum number of s3 reads in flight at once,
+                also used as the client connection pool size
         """
         self.bucket_name = bucket_name
         self.prefix = prefix
@@ -34,58 +47,69 @@ class AsyncS3DataLoader:
         )
         self.polars_args = polars_args
         self.tqdm_desc = tqdm_desc
+        self.max_concurrency = max_concurrency
 
-    async def read_from_s3(self, s3_client, full_path):
+    @staticmethod
+    def string_exprs():
+        """Builds expressions casting every column to pl.String.
+        Lists are comma joined and structs json encoded. Columns are matched
+        by dtype selectors, so the same expressions work for any schema.
+
+        Returns:
+            List of polars expressions
+        """
+        return [
+            cs.list().list.join(','),
+            cs.struct().struct.json_encode(),
+            cs.exclude(cs.list(), cs.struct()).cast(pl.String, strict=False),
+        ]
+
+    async def read_from_s3(self, s3_client, full_path, semaphore):
         """Reads a file from s3
 
         First extracts s3 key from the bucket to be processed by the client
         Retreives and loads data asynchronously into memory
         Data is then read sequentially by polars with any arguments applied
+        At most max_concurrency downloads run at once, however large the chunk
 
         Args:
             s3_client: An aioboto3.Session()
             full_path: The full directory path of the file on s3
+            semaphore: asyncio.Semaphore limiting the reads in flight
 
         Returns:
             Polars dataframe
         """
         key = full_path.replace(f's3://{self.bucket_name}/', '')
         try:
-            response = await s3_client.get_object(Bucket=self.bucket_name, Key=key)
-            data = await response['Body'].read()
+            async with semaphore:
+                response = await s3_client.get_object(Bucket=self.bucket_name, Key=key)
+                data = await response['Body'].read()
             df = pl.read_parquet(io.BytesIO(data))
             if self.polars_args:
                 df = self.polars_args(df)
             else:
-                new_cols = []
-                for col in df.columns:
-                    dtype = df.schema[col]
-                    if isinstance(dtype, pl.List):
-                        new_cols.append(pl.col(col).list.join(',').alias(col))
-                    elif isinstance(dtype, pl.Struct):
-                        new_cols.append(pl.col(col).struct.json_encode().alias(col))
-                    else:
-                        new_cols.append(
-                            pl.col(col).cast(pl.String, strict=False).alias(col)
-                        )
-                df = df.with_columns(new_cols)
+                df = df.with_columns(self.string_exprs())
 
             return df
         except s3_client.exceptions.NoSuchKey:
             return None
 
-    async def process_chunks(self, s3_client, chunk_list):
+    async def process_chunks(self, s3_client, chunk_list, semaphore):
         """Processes a chunk of paths to be read_from_s3
 
         Args:
             s3_client: An aioboto3.Session()
             chunk_list: The full directory of all files in a chunk
+            semaphore: asyncio.Semaphore limiting the reads in flight
 
         Returns:
             A list of Polars dataframes
         """
         tasks = [
-            self.read_from_s3(s3_client=s3_client, full_path=full_path)
+            self.read_from_s3(
+                s3_client=s3_client, full_path=full_path, semaphore=semaphore
+            )
             for full_path in chunk_list
         ]
         results = await asyncio.gather(*tasks)
@@ -94,18 +118,43 @@ class AsyncS3DataLoader:
     async def async_chunk_run(self):
         """Chunks data, processes, and save to output_dir
 
+        Frames from every chunk go into one flat list and are concatenated
+        once, without rechunking, so buffers are referenced rather than copied.
+
         Returns:
             Unified Polars dataframe
         """
         all_dataframes = []
-        async with aioboto3.Session().client('s3') as s3_client:
+        # Created per run, a semaphore is bound to the event loop it is used in
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        config = Config(max_pool_connections=self.max_concurrency)
+        async with aioboto3.Session().client('s3', config=config) as s3_client:
             for i in tqdm(
                 range(0, len(self.path_list), self.chunks),
                 desc=f'Loading {self.tqdm_desc} chunked data from s3',
             ):
                 chunk_list = self.path_list[i : i + self.chunks]
-                chunk_dataframes = await self.process_chunks(s3_client, chunk_list)
-                if chunk_dataframes:
-                    df = pl.concat(chunk_dataframes)
-                    all_dataframes.append(df)
-        return pl.concat(all_dataframes)
+                all_dataframes.extend(
+                    await self.process_chunks(s3_client, chunk_list, semaphore)
+                )
+        return pl.concat(all_dataframes, rechunk=False)
+
+    def scan(self, storage_options=None):
+        """Lazily scans every file under the prefix with polars' native reader
+
+        Alternative to async_chunk_run: files are fetched by polars' object
+        store reader in parallel and streamed into a single LazyFrame, with no
+        per-file download, decode or concat in python. polars_args (or the
+        default string conversion) is piped lazily on top of the scan, so its
+        filters and selects are pushed down into the parquet reader.
+
+        Args:
+            storage_options: dict - Optional cloud options passed to polars
+
+        Returns:
+            Polars LazyFrame
+        """
+        lf = pl.scan_parquet(self.path_list, storage_options=storage_options)
+        if self.polars_args:
+            return lf.pipe(self.polars_args)
+        return lf.with_columns(self.string_exprs())
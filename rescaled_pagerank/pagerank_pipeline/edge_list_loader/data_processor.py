@@ -1,8 +1,10 @@
+import datetime
 import os
-import random
 
 import polars as pl
 
+from ..async_loader.data_loader import AsyncS3DataLoader
+
 
 class PageRankDataProcessor:
     """Processes data ready to be loaded into graph.
@@ -16,6 +18,7 @@ class PageRankDataProcessor:
         info_path: str - Optinal local storage of processed info dataframe
         save_locally: bool - Optional arg whether to save data locally
         date_cutoff: str - Optional date cutoff to filter publications
+        seed: int - Optional seed for the random day/month of partial dates
     """
 
     def __init__(
@@ -34,6 +37,7 @@ class PageRankDataProcessor:
         info_date_field='publication_date',
         info_publication_type_field='publication_type',
         publication_type_value='publication',
+        seed=None,
     ):
         """Initializes the data processor
 
@@ -46,6 +50,7 @@ class PageRankDataProcessor:
             info_path: str - Optinal local storage of processed info dataframe
             save_locally: bool - Optional arg whether to save data locally
             date_cutoff: str - Optional date cutoff to filter publications
+            seed: int - Optional seed for the random day/month of partial dates
         """
         self.info_prefix = info_prefix
         self.edges_prefix = edges_prefix
@@ -63,12 +68,15 @@ class PageRankDataProcessor:
         self.info_date_field = info_date_field
         self.info_publication_type_field = info_publication_type_field
         self.publication_type_value = publication_type_value
+        self.id_dtype = pl.UInt32
+        self.seed = seed
 
     def pub_info_polars_args(self, df):
         """Defines specific polars args used for pagerank info dataset.
         Types are handled via cast due to some inconsistencies
         in the bulk extract. Data as pl.String to allow for later
-        manipulation.
+        manipulation. Columns the schema already has as pl.String
+        are selected as is, without a cast.
 
         Args:
             df - A Polars dataframe
@@ -76,19 +84,26 @@ class PageRankDataProcessor:
         Returns:
             df - A filtered polars dataframe
         """
+        schema = df.collect_schema()
         return df.filter(
             pl.col(self.info_publication_type_field).is_in(
                 [self.publication_type_value]
             )
         ).select(
             [
-                pl.col(self.info_publication_id).cast(pl.String, strict=False),
-                pl.col(self.info_date_field).cast(pl.String, strict=False),
+                pl.col(column)
+                if schema[column] == pl.String
+                else pl.col(column).cast(pl.String, strict=False)
+                for column in (self.info_publication_id, self.info_date_field)
             ]
         )
 
     def graph_data_polars_args(self, df):
         """Defines polars args used for pagerank edge list
+        Edge ids are converted to numeric (id_dtype) and renamed to generic
+        source/target for graph construction, in a single select.
+        Ids too large for id_dtype cannot be in info_df, they become null and
+        are dropped with the other unknown ids in remove_edges_before_publish_date.
 
         Args:
             df - A polars dataframe
@@ -98,54 +113,59 @@ class PageRankDataProcessor:
         """
         return df.select(
             [
-                pl.col(self.edge_publication_id_citing),
-                pl.col(self.edge_publication_id_cited),
+                self.id_to_numeric(
+                    self.edge_publication_id_citing, self.id_dtype, strict=False
+                ).alias('source'),
+                self.id_to_numeric(
+                    self.edge_publication_id_cited, self.id_dtype, strict=False
+                ).alias('target'),
             ]
         )
 
     @staticmethod
-    def fill_date(date_str):
+    def fill_date(date_field, length=None, seed=None):
         """Applies random day and or month for pubs with incomplete publish
         dates. Avoids huge paper clusters at 1st Jan for example.
+        Random values are drawn per row by polars, no python callback, and
+        the parts are joined with pl.format. Month and day come from a single
+        draw over every (month, day) pair, so one seed gives independent values.
 
         Args:
-            date_str - column - Date column (str date) of pub publish date
+            date_field - str - Date column (str date) of pub publish date
+            length - Optional expression of the date string length
+            seed - Optional int seed, fresh random values if None
 
         Returns:
-            filled date column
+            filled date expression (str date)
         """
-        parts = date_str.split('-')
-        if len(parts) == 1:
-            month = random.randint(1, 12)
-            day = random.randint(1, 28)
-            return f'{parts[0]}-{month:02d}-{day:02d}'
-        elif len(parts) == 2:
-            day = random.randint(1, 28)
-            return f'{parts[0]}-{parts[1]}-{day:02d}'
-        return date_str
+        date = pl.col(date_field)
+        if length is None:
+            length = date.str.len_chars()
+        draw = pl.int_range(0, 12 * 28).sample(
+            pl.len(), with_replacement=True, seed=seed
+        )
+        month = (draw // 28 + 1).cast(pl.String).str.zfill(2)
+        day = (draw % 28 + 1).cast(pl.String).str.zfill(2)
+        return (
+            pl.when(length < 7)
+            .then(pl.format('{}-{}-{}', date, month, day))
+            .when(length < 10)
+            .then(pl.format('{}-{}', date, day))
+            .otherwise(date)
+        )
 
     def clean_date(self):
-        """Cleans date calling fill_date and converting output to pl.Date col"""
+        """Drops publications whose filled date (see prepare_min_date) is invalid"""
         if self.info_df is not None:
-            self.info_df = self.info_df.with_columns(
-                pl.col(self.info_date_field)
-                .map_elements(self.fill_date, return_dtype=pl.Utf8)
-                .str.strptime(pl.Date, '%Y-%m-%d', strict=False)
-                .alias(self.info_date_field)
-            ).drop_nulls(subset=self.info_date_field)
+            self.info_df = self.info_df.drop_nulls(subset=self.info_date_field)
 
     def filter_date_cutoff(self):
         """Filters the dataframe to only include publications before a certain date."""
         if self.date_cutoff is not None and self.info_df is not None:
-            cutoff = pl.lit(self.date_cutoff).str.strptime(pl.Date, '%Y-%m-%d')
+            cutoff = pl.lit(datetime.date.fromisoformat(self.date_cutoff))
             date_col = (
                 '_min_date'
-                if '_min_date'
-                in (
-                    self.info_df.schema
-                    if isinstance(self.info_df, pl.LazyFrame)
-                    else self.info_df.columns
-                )
+                if '_min_date' in self.info_df.collect_schema().names()
                 else self.info_date_field
             )
             self.info_df = self.info_df.filter(pl.col(date_col) < cutoff)
@@ -153,128 +173,187 @@ class PageRankDataProcessor:
     def prepare_min_date(self):
         """Create a deterministic minimal date column (_min_date) from partial date strings.
         This is used solely for temporal edge pruning to avoid randomness affecting DAG determination.
+
+        The randomly filled publish date (fill_date) is built in the same pass,
+        both reading a cached string length, and converted to a pl.Date col.
         """
         if self.info_df is not None:
-            year = pl.col(self.info_date_field).str.slice(0, 4)
-            month = pl.when(pl.col(self.info_date_field).str.len_chars() >= 7)
-            month = month.then(pl.col(self.info_date_field).str.slice(5, 2)).otherwise(
-                pl.lit('01')
+            date = pl.col(self.info_date_field)
+            length = pl.col('_date_len')
+            year = date.str.slice(0, 4)
+            month = (
+                pl.when(length >= 7).then(date.str.slice(5, 2)).otherwise(pl.lit('01'))
             )
-            day = pl.when(pl.col(self.info_date_field).str.len_chars() >= 10)
-            day = day.then(pl.col(self.info_date_field).str.slice(8, 2)).otherwise(
-                pl.lit('01')
+            day = (
+                pl.when(length >= 10).then(date.str.slice(8, 2)).otherwise(pl.lit('01'))
             )
 
-            self.info_df = self.info_df.with_columns(
-                (year + pl.lit('-') + month + pl.lit('-') + day)
-                .str.strptime(pl.Date, '%Y-%m-%d', strict=False)
-                .alias('_min_date')
+            self.info_df = (
+                self.info_df.with_columns(date.str.len_chars().alias('_date_len'))
+                .with_columns(
+                    [
+                        pl.format('{}-{}-{}', year, month, day)
+                        .str.to_date('%Y-%m-%d', strict=False, exact=True, cache=True)
+                        .alias('_min_date'),
+                        self.fill_date(self.info_date_field, length, self.seed)
+                        .str.to_date('%Y-%m-%d', strict=False, exact=True, cache=True)
+                        .alias(self.info_date_field),
+                    ]
+                )
+                .drop('_date_len')
             )
 
     def remove_edges_before_publish_date(self):
         """This function removes impossible edges which exist due to
         data quality issues in the bulk extract. This should make the
-        graph acyclic. Still check later with graph-tool is_DAG.
+        graph acyclic. Still checked later with topological_order in PageRank.
+
+        Minimal dates are attached per edge end by inner joins on the
+        id -> _min_date projection of the collected info_df, so the edge
+        list stays a lazy plan. Ids without a known date are dropped.
         """
         if self.info_df is not None and self.df is not None:
-            info_min = self.info_df.select(
-                [
-                    pl.col(self.info_publication_id).alias('pid'),
-                    pl.col('_min_date'),
-                ]
+            min_dates = (
+                self.info_df.lazy()
+                .select([pl.col(self.info_publication_id), pl.col('_min_date')])
+                .drop_nulls(subset='_min_date')
             )
-
-            self.df = self.df.join(
-                info_min.rename({'pid': 'citing_pid', '_min_date': 'citing_min_date'}),
-                left_on=self.edge_publication_id_citing,
-                right_on='citing_pid',
-                how='inner',
-            ).join(
-                info_min.rename({'pid': 'cited_pid', '_min_date': 'cited_min_date'}),
-                left_on=self.edge_publication_id_cited,
-                right_on='cited_pid',
-                how='inner',
+            self.df = (
+                self.df.join(
+                    min_dates.rename(
+                        {
+                            self.info_publication_id: 'source',
+                            '_min_date': '_citing_min_date',
+                        }
+                    ),
+                    on='source',
+                    how='inner',
+                )
+                .join(
+                    min_dates.rename(
+                        {
+                            self.info_publication_id: 'target',
+                            '_min_date': '_cited_min_date',
+                        }
+                    ),
+                    on='target',
+                    how='inner',
+                )
+                .filter(pl.col('_cited_min_date') < pl.col('_citing_min_date'))
+                .drop(['_citing_min_date', '_cited_min_date'])
             )
 
-            self.df = self.df.filter(
-                pl.col('cited_min_date') < pl.col('citing_min_date')
-            )
+    @staticmethod
+    def id_to_numeric(column_name, dtype=pl.UInt32, strict=True):
+        """Removes 'pub.' prefix (literal, no regex) and turns into an integer
+        Used for much faster hashing in graph construction.
 
-            self.df = self.df.select(
-                [
-                    pl.col(self.edge_publication_id_citing),
-                    pl.col(self.edge_publication_id_cited),
-                ]
-            )
+        Args:
+            column_name - str - ID column
+            dtype - polars integer type of the numeric id
+            strict - bool - raise on ids that do not fit dtype, else null
+
+        Returns:
+            numeric id expression
+        """
+        return pl.col(column_name).str.strip_prefix('pub.').cast(dtype, strict=strict)
 
     @staticmethod
-    def ids_to_numeric(df, column_name):
-        """Removed 'pub' and turns into an integer
-        Used for much faster hashing in graph construction
+    def ids_to_numeric(df, *column_names, dtype=pl.UInt32):
+        """Converts id column(s) in place with id_to_numeric.
+        All columns are converted in a single with_columns.
 
         Args:
-            df - A polars dataframe (edge list)
-            column_name - ID column
+            df - A polars dataframe
+            column_names - ID column(s)
+            dtype - polars integer type of the numeric ids
 
         Returns:
             df - A polars dataframe with numeric ids
         """
         return df.with_columns(
-            pl.col(column_name)
-            .str.replace('^pub\\.', '')
-            .cast(pl.Int64)
-            .alias(column_name)
+            [
+                PageRankDataProcessor.id_to_numeric(column_name, dtype)
+                for column_name in column_names
+            ]
         )
 
-    def define_source_target(self):
-        """Rename original id columns to generic source/target for graph construction."""
-        if self.df is not None:
-            self.df = self.df.rename(
-                {
-                    self.edge_publication_id_citing: 'source',
-                    self.edge_publication_id_cited: 'target',
-                }
-            )
+    def numeric_id_dtype(self):
+        """Picks the integer type for numeric ids from the largest info id.
+        UInt32 halves the memory and hashing cost of Int64 ids, UInt64 is
+        only used if an id does not fit.
+
+        Returns:
+            pl.UInt32 or pl.UInt64
+        """
+        max_id = self.info_df.select(
+            self.id_to_numeric(self.info_publication_id, pl.UInt64).max()
+        ).item()
+        if max_id is not None and max_id > 2**32 - 1:
+            return pl.UInt64
+        return pl.UInt32
 
     def process_data(self):
         """Methods to run data_processor:
         - load_publication_info
-        - load_graph_data
-        - prepare_min_date & filter_date_cutoff (deterministic minimal date)
+        - prepare_min_date & filter_date_cutoff (deterministic minimal date,
+          random date augmentation computed in the same pass)
+        - deduplicates and collects info_df, it is small and referenced by
+          several joins
+        - converts dimensions ids to numeric version (UInt32 unless an info
+          id needs UInt64)
+        - load_graph_data, numeric ids defining source and target for graph
+          construction are selected in the same pass as the scan
         - removes not possible edges (using minimal dates)
-        - clean_date (random date augmentation applied AFTER pruning)
-        - converts dimensions ids to numeric version
-        - defines source and target for graph construction
+        - clean_date (drops invalid augmented dates AFTER pruning)
         - optional saving of processed data
-        """
-        self.info_df = pl.scan_parquet(f's3://datalabs-data/{self.info_prefix}')
-        self.df = pl.scan_parquet(f's3://datalabs-data/{self.edges_prefix}')
 
-        self.info_df = self.pub_info_polars_args(self.info_df)
-        self.df = self.graph_data_polars_args(self.df)
+        Both inputs are lazy scans from AsyncS3DataLoader.scan with the
+        polars args piped on top. The edge list stays a LazyFrame and is
+        collected once at the end. info_df is collected once up front, so
+        its scan is not repeated for the id type check and each join.
+        """
+        self.info_df = AsyncS3DataLoader(
+            self.bucket_name,
+            self.info_prefix,
+            self.chunks,
+            polars_args=self.pub_info_polars_args,
+            tqdm_desc='publication info',
+        ).scan()
 
         self.prepare_min_date()
         if self.date_cutoff:
             self.filter_date_cutoff()
-
-        self.remove_edges_before_publish_date()
-
-        self.clean_date()
-
-        self.df = PageRankDataProcessor.ids_to_numeric(
-            self.df, self.edge_publication_id_cited
+        # Unparsable dates are dropped where the id has a row with valid ones,
+        # so a valid duplicate is kept
+        invalid_date = (
+            pl.col(self.info_date_field).is_null() | pl.col('_min_date').is_null()
         )
-        self.df = PageRankDataProcessor.ids_to_numeric(
-            self.df, self.edge_publication_id_citing
+        self.info_df = (
+            self.info_df.filter(
+                ~invalid_date | invalid_date.all().over(self.info_publication_id)
+            )
+            .unique(subset=self.info_publication_id, keep='first')
+            .collect(engine='streaming')
         )
+
+        self.id_dtype = self.numeric_id_dtype()
+
+        self.df = AsyncS3DataLoader(
+            self.bucket_name,
+            self.edges_prefix,
+            self.chunks,
+            polars_args=self.graph_data_polars_args,
+            tqdm_desc='edge list',
+        ).scan()
         self.info_df = PageRankDataProcessor.ids_to_numeric(
-            self.info_df, self.info_publication_id
+            self.info_df, self.info_publication_id, dtype=self.id_dtype
         )
+        self.remove_edges_before_publish_date()
 
-        self.define_source_target()
+        self.clean_date()
 
-        self.info_df = self.info_df.collect(streaming=True)
-        self.df = self.df.collect(streaming=True)
+        self.df = self.df.collect(engine='streaming')
         if self.save_locally:
             if self.edge_path is not None:
                 os.makedirs(os.path.dirname(self.edge_path), exist_ok=True)
@@ -1,5 +1,103 @@
+import numpy as np
 import polars as pl
-from graph_tool.all import Graph, is_DAG, pagerank
+import scipy.sparse as sp
+from numba import get_num_threads, njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def csr_matvec(indptr, indices, data, x, out, bounds):
+    """Multi-threaded CSR sparse matrix-vector product, out = M @ x
+
+    Rows are split into blocks of roughly equal non-zeros (bounds) and each
+    thread writes only its own rows of out, so there is no write contention.
+
+    Args:
+        indptr, indices, data: np.ndarray - CSR arrays of M
+        x: np.ndarray - dense vector to multiply
+        out: np.ndarray - preallocated output vector, one value per row
+        bounds: np.ndarray - row index at which each block starts, plus N
+    """
+    for block in prange(bounds.shape[0] - 1):
+        for row in range(bounds[block], bounds[block + 1]):
+            total = 0.0
+            for k in range(indptr[row], indptr[row + 1]):
+                total += data[k] * x[indices[k]]
+            out[row] = total
+
+
+@njit(cache=True)
+def topological_order(indptr, indices):
+    """Orders vertices so every edge points forward, or detects a cycle
+
+    Depth first search over the in edges of M: a vertex is emitted once all
+    the vertices citing it have been, so no transposed copy of M is needed.
+    Reaching a vertex that is still on the stack means there is a cycle.
+
+    Args:
+        indptr, indices: np.ndarray - CSR arrays of M (the in edges)
+
+    Returns:
+        np.ndarray of vertex indices in topological order, shorter than N
+        when the graph has a cycle
+    """
+    n = indptr.shape[0] - 1
+    # 0 - not visited, 1 - on the stack, 2 - emitted
+    state = np.zeros(n, dtype=np.int8)
+    order = np.empty(n, dtype=np.int64)
+    stack = np.empty(n, dtype=np.int64)
+    next_edge = np.empty(n, dtype=np.int64)
+    tail = 0
+    for root in range(n):
+        if state[root] != 0:
+            continue
+        depth = 0
+        stack[0] = root
+        next_edge[0] = indptr[root]
+        state[root] = 1
+        while depth >= 0:
+            vertex = stack[depth]
+            k = next_edge[depth]
+            if k < indptr[vertex + 1]:
+                next_edge[depth] = k + 1
+                citing = indices[k]
+                if state[citing] == 1:
+                    return order[:tail]
+                if state[citing] == 0:
+                    state[citing] = 1
+                    depth += 1
+                    stack[depth] = citing
+                    next_edge[depth] = indptr[citing]
+            else:
+                state[vertex] = 2
+                order[tail] = vertex
+                tail += 1
+                depth -= 1
+    return order
+
+
+@njit(cache=True)
+def topological_sweep(indptr, indices, data, pers, order, damping):
+    """Solves y = damping * M @ y + pers in one in-place (Gauss-Seidel) sweep
+
+    Visiting vertices in topological order means every in-neighbour is
+    already final, so a single pass is exact on a DAG.
+
+    Args:
+        indptr, indices, data: np.ndarray - CSR arrays of M
+        pers: np.ndarray - personalisation vector
+        order: np.ndarray - topological order from topological_order
+        damping: float - damping (telportation) for PageRank
+
+    Returns:
+        np.ndarray y, proportional to the PageRank scores
+    """
+    y = np.empty_like(pers)
+    for vertex in order:
+        total = 0.0
+        for k in range(indptr[vertex], indptr[vertex + 1]):
+            total += data[k] * y[indices[k]]
+        y[vertex] = damping * total + pers[vertex]
+    return y
 
 
 class PageRank:
@@ -10,9 +108,13 @@ class PageRank:
         iterations: int - max number of iterations to run
         damping: float - damping (telportation) for PageRank
         epsilon: float - epsilon for PageRank to determine convergence
+        dtype: numpy float dtype of the rank vector and transition matrix
+        allow_cycles: bool - run power iteration on graphs that are not a DAG
     """
 
-    def __init__(self, df, iterations, damping, epsilon):
+    def __init__(
+        self, df, iterations, damping, epsilon, dtype=np.float64, allow_cycles=False
+    ):
         """Initialises PageRank class
 
         Args:
@@ -20,6 +122,12 @@ class PageRank:
             iterations: int - max number of iterations to run
             damping: float - damping (telportation) for PageRank
             epsilon: float - epsilon for PageRank to determine convergence
+            dtype: numpy float dtype of the rank vector and transition matrix.
+                np.float32 halves the memory traffic of each SpMV, but ranks are
+                then only accurate to ~1e-7 so epsilon must be set accordingly.
+            allow_cycles: bool - run power iteration on graphs that are not a
+                DAG instead of refusing them. Cycles mean pruning of impossible
+                edges failed, so this is off by default.
 
         Returns:
             None
@@ -28,119 +136,199 @@ class PageRank:
         self.iterations = iterations
         self.damping = damping
         self.epsilon = epsilon
+        self.dtype = dtype
+        self.allow_cycles = allow_cycles
 
     def load_graph(self):
-        """Loads polars dataframe (edge list) into a graph
+        """Loads polars dataframe (edge list) into compact vertex indices
+
+        Publication ids are mapped to 0..N-1 with np.unique so the edge list
+        can be turned straight into sparse arrays, no graph object is built.
 
         Returns:
-            g - A graph-tool directed graph
-            hash_map - VertexPropertyMap of hashed graph vertices to publication ids
+            ids - np.ndarray of publication ids, position is the vertex index
+            source - np.ndarray of citing vertex index for each edge
+            target - np.ndarray of cited vertex index for each edge
         """
-        g = Graph(directed=True)
-        edge_list = self.df.to_numpy()
-        hash_map = g.add_edge_list(edge_list, hashed=True)
-        return g, hash_map
+        source = self.df.to_series(0).to_numpy()
+        target = self.df.to_series(1).to_numpy()
+        ids, vertices = np.unique(np.concatenate([source, target]), return_inverse=True)
+        return ids, vertices[: len(source)], vertices[len(source) :]
 
-    def run_pagerank(self, g, pers=None):
-        """Calculates PageRank for a given graph
-        Uses graph-tool library
+    def build_transition_matrix(self, source, target, in_degree, out_degree):
+        """Builds the sparse transition matrix of a graph for PageRank
+
+        Each edge u -> v contributes 1 / out_degree(u) to M[v, u] so that
+        a single sparse matrix-vector product propagates rank along edges.
+        The CSR arrays are built directly: edges are ordered by target and
+        row pointers come from the cumulative in degree.
 
         Args:
-            g - A graph-tool directed graph
-            pers - Optional extra personalisation arguments
+            source - np.ndarray of citing vertex index for each edge
+            target - np.ndarray of cited vertex index for each edge
+            in_degree - np.ndarray of in degrees in vertex order
+            out_degree - np.ndarray of out degrees in vertex order
 
         Returns:
-            page_rank_scores - VertexPropertyMap of pageranks for each node
-            has_converged - number of iterations to converge or max
+            M - scipy CSR matrix (N x N) of transition probabilities
+            dangling - np.ndarray of vertex indices with no out edges
         """
-        page_rank_scores, has_converged = pagerank(
-            g,
-            damping=self.damping,
-            pers=pers,
-            weight=None,
-            prop=None,
-            epsilon=self.epsilon,
-            max_iter=self.iterations,
-            ret_iter=True,
-        )
-        return page_rank_scores, has_converged
+        n = len(in_degree)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(in_degree, out=indptr[1:])
+        indices = source[np.argsort(target, kind='stable')]
+        data = np.reciprocal(out_degree[indices], dtype=self.dtype)
+        M = sp.csr_matrix((data, indices, indptr), shape=(n, n))
+        # Parallel edges become one summed entry, the SpMV result is unchanged
+        # but csgraph routines slow down badly on duplicate entries
+        M.sum_duplicates()
+        dangling = np.flatnonzero(out_degree == 0)
+        return M, dangling
+
+    def run_pagerank(self, M, dangling, order, pers=None):
+        """Calculates PageRank over a sparse transition matrix
 
-    def get_hashed_ids(self, g, hash_map):
-        """Converts hashed vertices to publication ids
+        On a DAG the linear system is solved exactly by one sweep in
+        topological order (topological_sweep). Rank held by dangling vertices
+        goes back to every vertex through pers, so the sweep result only has
+        to be normalised to sum to one. Graphs with cycles (order shorter
+        than N) are run with power_iteration. Vectors use self.dtype.
 
         Args:
-            g - a graph-tool graph
-            hash_map - graph-tool map between hashed ids and ids
+            M - scipy CSR transition matrix from build_transition_matrix
+            dangling - np.ndarray of vertex indices with no out edges
+            order - np.ndarray from topological_order
+            pers - Optional personalisation vector (np.ndarray), uniform if None
 
         Returns:
-            list of publication_ids in order
+            page_rank_scores - np.ndarray of pageranks in vertex order
+            has_converged - number of iterations to converge or max
         """
-        return [hash_map[v] for v in g.vertices()]
+        n = M.shape[0]
+        if pers is None:
+            pers = np.full(n, 1.0 / n, dtype=self.dtype)
+        else:
+            pers = (np.asarray(pers, dtype=np.float64) / np.sum(pers)).astype(
+                self.dtype
+            )
 
-    def get_in_degree(self, g):
-        """Calculates in degree of a graph (citations)
+        if order.shape[0] < n:
+            return self.power_iteration(M, dangling, pers)
+
+        page_rank_scores = topological_sweep(
+            M.indptr, M.indices, M.data, pers, order, self.damping
+        )
+        page_rank_scores *= 1.0 / page_rank_scores.sum(dtype=np.float64)
+        return page_rank_scores, 1
+
+    def power_iteration(self, M, dangling, pers):
+        """Calculates PageRank by power iteration, for graphs with cycles
+
+        Rank held by dangling vertices is redistributed according to the
+        personalisation vector, matching graph-tool's pagerank. The dangling
+        and convergence sums use float64. The SpMV runs in parallel over row
+        blocks with csr_matvec.
 
         Args:
-            g - a graph-tool graph
+            M - scipy CSR transition matrix from build_transition_matrix
+            dangling - np.ndarray of vertex indices with no out edges
+            pers - personalisation vector (np.ndarray) summing to one
+
         Returns:
-            list of in_degrees in order
+            page_rank_scores - np.ndarray of pageranks in vertex order
+            has_converged - number of iterations to converge or max
         """
-        return g.get_in_degrees(g.get_vertices())
+        # Blocks of ~equal non-zeros, several per thread to even out the load
+        blocks = get_num_threads() * 4
+        bounds = np.searchsorted(M.indptr, np.linspace(0, M.nnz, blocks + 1))
+        bounds[-1] = M.shape[0]
 
-    def get_out_degree(self, g):
-        """Calculates out degree of a graph (references)
+        page_rank_scores = pers.copy()
+        new_scores = np.empty_like(pers)
+        for has_converged in range(1, self.iterations + 1):
+            dangling_rank = float(page_rank_scores[dangling].sum(dtype=np.float64))
+            csr_matvec(
+                M.indptr, M.indices, M.data, page_rank_scores, new_scores, bounds
+            )
+            new_scores *= self.damping
+            new_scores += (1 - self.damping + self.damping * dangling_rank) * pers
+            delta = np.abs(new_scores - page_rank_scores).sum(dtype=np.float64)
+            page_rank_scores, new_scores = new_scores, page_rank_scores
+            if delta < self.epsilon:
+                break
+        return page_rank_scores, has_converged
+
+    def get_in_degree(self, target, n):
+        """Calculates in degree of a graph (citations)
 
         Args:
-            g - a graph-tool graph
+            target - np.ndarray of cited vertex index for each edge
+            n - int - number of vertices
 
         Returns:
-            list of out degrees in order
+            np.ndarray of in_degrees in vertex order
         """
-        return g.get_out_degrees(g.get_vertices())
+        return np.bincount(target, minlength=n)
 
-    def get_pagerank_scores(self, g, page_rank_scores):
-        """Returns pagerank scores from a VertexPropertyMap
+    def get_out_degree(self, source, n):
+        """Calculates out degree of a graph (references)
 
         Args:
-            g - a graph-tool graph
-            page_rank_scores - a VertexPropertyMap
+            source - np.ndarray of citing vertex index for each edge
+            n - int - number of vertices
 
         Returns:
-            list of pagerank scores in order
+            np.ndarray of out degrees in vertex order
         """
-        return [page_rank_scores[v] for v in g.vertices()]
+        return np.bincount(source, minlength=n)
 
-    def combine_into_dataframe(self, g, hash_map, page_rank_scores):
+    def combine_into_dataframe(self, ids, in_degree, out_degree, page_rank_scores):
         """Combines order list of metrics into a polars dataframe
 
         Args:
-            g - a graph-tool graph
-            hash_map - VertexPropertyMap of hashed vertices to pub ids
-            page_rank_scores - VertexPropertyMap of pagerank scores
+            ids - np.ndarray of publication ids in vertex order
+            in_degree - np.ndarray of in degrees in vertex order
+            out_degree - np.ndarray of out degrees in vertex order
+            page_rank_scores - np.ndarray of pagerank scores in vertex order
 
         Returns:
             Polars dataframe of given metrics
         """
         return pl.DataFrame(
             {
-                'id': self.get_hashed_ids(g, hash_map),
-                'page_rank': self.get_pagerank_scores(g, page_rank_scores),
-                'in_degree': self.get_in_degree(g),
-                'out_degree': self.get_out_degree(g),
+                'id': ids,
+                'page_rank': page_rank_scores.astype(np.float64, copy=False),
+                'in_degree': in_degree,
+                'out_degree': out_degree,
             }
         )
 
     def process_pagerank(self):
         """Processes pagerank class if constructed graph as a DAG
 
+        Degrees are computed once and shared by the transition matrix and
+        the output dataframe. The topological order doubles as the DAG
+        check. A graph with cycles is refused unless allow_cycles is set,
+        in which case it is run by power iteration.
+
         Retuns:
             Enriched PageRank polars dataframe or None
         """
-        g, hash_map = self.load_graph()
-        if is_DAG(g):
-            page_rank_scores, has_converged = self.run_pagerank(g)
-            print(f'Pagerank converged after {has_converged} iterations')
-            return self.combine_into_dataframe(g, hash_map, page_rank_scores)
-        else:
-            print('Graph is not a DAG, please investigate the data source')
-            return None
+        ids, source, target = self.load_graph()
+        in_degree = self.get_in_degree(target, len(ids))
+        out_degree = self.get_out_degree(source, len(ids))
+        M, dangling = self.build_transition_matrix(
+            source, target, in_degree, out_degree
+        )
+        order = topological_order(M.indptr, M.indices)
+        if order.shape[0] < len(ids):
+            if not self.allow_cycles:
+                print('Graph is not a DAG, please investigate the data source')
+                return None
+            print(
+                'Graph is not a DAG, please investigate the data source. '
+                'Running power iteration as cycles are allowed'
+            )
+        page_rank_scores, has_converged = self.run_pagerank(M, dangling, order)
+        print(f'Pagerank converged after {has_converged} iterations')
+        return self.combine_into_dataframe(ids, in_degree, out_degree, page_rank_scores)
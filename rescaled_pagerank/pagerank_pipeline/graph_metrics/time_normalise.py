@@ -1,5 +1,62 @@
+import numpy as np
 import polars as pl
-from sklearn.preprocessing import MinMaxScaler
+from numba import njit
+
+
+@njit(cache=True, error_model='numpy')
+def rolling_mean_std(values, window_size):
+    """Centred rolling mean and sample std in a single O(N) pass
+
+    Welford's update adds the value entering the window and removes the one
+    leaving it, so the cost does not grow with window_size. The statistics
+    are recomputed exactly once every window_size steps (O(N) overall) to
+    bound rounding drift, and a window of one repeated value gets an exact
+    std of 0. Windows are aligned as polars' rolling_*(window_size, center=True).
+
+    Args:
+        values: np.ndarray - float64 values in window order, no NaNs
+        window_size: int - given window to aggregate over
+
+    Returns:
+        means - np.ndarray of rolling means, NaN where the window is incomplete
+        stds - np.ndarray of rolling stds (ddof=1), NaN where incomplete
+    """
+    n = values.shape[0]
+    means = np.full(n, np.nan)
+    stds = np.full(n, np.nan)
+    offset = window_size // 2
+    mean = 0.0
+    m2 = 0.0
+    run = 0
+    for j in range(n):
+        value = values[j]
+        run = run + 1 if j > 0 and value == values[j - 1] else 1
+        if run >= window_size:
+            # Window holds a single repeated value, reset to exact zero spread
+            mean = value
+            m2 = 0.0
+        elif (j + 1) % window_size == 0:
+            # Exact two-pass recompute once per window bounds rounding drift
+            start = j + 1 - window_size
+            mean = values[start : j + 1].mean()
+            m2 = 0.0
+            for k in range(start, j + 1):
+                m2 += (values[k] - mean) ** 2
+        elif j < window_size:
+            delta = value - mean
+            mean += delta / (j + 1)
+            m2 += delta * (value - mean)
+        else:
+            leaving = values[j - window_size]
+            new_mean = mean + (value - leaving) / window_size
+            m2 += (value - leaving) * (value - new_mean + leaving - mean)
+            mean = new_mean
+        if j >= window_size - 1:
+            means[j - window_size + 1 + offset] = mean
+            stds[j - window_size + 1 + offset] = np.sqrt(
+                max(m2, 0.0) / (window_size - 1)
+            )
+    return means, stds
 
 
 class TimeNormalise:
@@ -82,6 +139,8 @@ class TimeNormalise:
     def compute_rescaled_scores(self, window_size):
         """Computes rolling mean, deviation, rolling std, and z scores for a
         given metric. This is computed on a date ordered dataframe overa given window.
+        Rolling statistics come from rolling_mean_std, whose cost does not
+        depend on window_size (unlike polars' rolling_std).
 
         Args:
             window_size: int - given window to aggregate over
@@ -90,33 +149,19 @@ class TimeNormalise:
             Enriched dataframe with rescaled_pr (z score) as well as the mean and std.
         """
         self.df = self.df.sort(self.date)
-        result_df = self.df.with_columns(
-            [
-                pl.col(self.field)
-                .rolling_mean(window_size, center=True)
-                .alias('rolling_mean')
-            ]
-        )
-        result_df = result_df.with_columns(
-            [
-                (pl.col(self.field) - pl.col('rolling_mean')).alias('deviation'),
-                pl.col(self.field)
-                .rolling_std(window_size, center=True)
-                .alias('rolling_std'),
-            ]
-        ).with_columns(
-            [(pl.col('deviation') / pl.col('rolling_std')).alias('z_scores')]
+        means, stds = rolling_mean_std(
+            self.df[self.field].cast(pl.Float64).to_numpy(), window_size
         )
-
-        z_scores = result_df['z_scores'].fill_nan(None)
-        rolling_means = result_df['rolling_mean']
-        rolling_stds = result_df['rolling_std']
-
+        rolling_mean = pl.Series('rescaled_mean_pr', means, nan_to_null=True)
+        rolling_std = pl.Series('rescaled_std_pr', stds, nan_to_null=True)
         self.df = self.df.with_columns(
             [
-                z_scores.alias('rescaled_pr'),
-                rolling_means.alias('rescaled_mean_pr'),
-                rolling_stds.alias('rescaled_std_pr'),
+                pl.when(rolling_std > 0)
+                .then((pl.col(self.field) - rolling_mean) / rolling_std)
+                .otherwise(None)
+                .alias('rescaled_pr'),
+                rolling_mean,
+                rolling_std,
             ]
         )
 
@@ -131,15 +176,15 @@ class TimeNormalise:
         Returns:
             Enriched polars dataframe with non negative rescaled scores 'nn_rescaled_pr'
         """
-        scaler = MinMaxScaler()
-        rescaled_values = scaler.fit_transform(
-            self.df['rescaled_pr'].to_numpy().reshape(-1, 1)
-        )
-        self.df = self.df.with_columns(
-            pl.Series('nn_rescaled_pr', rescaled_values.flatten())
-        )
+        lo, hi = self.df.select(
+            [
+                pl.col('rescaled_pr').min().alias('lo'),
+                pl.col('rescaled_pr').max().alias('hi'),
+            ]
+        ).row(0)
+        span = (hi - lo) or 1.0
         self.df = self.df.with_columns(
-            (pl.col('nn_rescaled_pr') + 1e-13).alias('nn_rescaled_pr')
+            ((pl.col('rescaled_pr') - lo) / span + 1e-13).alias('nn_rescaled_pr')
         )
         return self.df
 
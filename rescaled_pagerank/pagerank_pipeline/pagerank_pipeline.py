@@ -1,7 +1,7 @@
 import argparse
 from datetime import datetime, timezone
 
-import awswrangler as wr
+import numpy as np
 import polars as pl
 
 from .edge_list_loader.data_processor import PageRankDataProcessor
@@ -23,18 +23,37 @@ def parse_args():
     )
     parser.add_argument(
         '--iterations',
+        type=int,
         default=1000,
-        help='Max number of iterations for PageRank',
+        help='Max number of power iterations for PageRank (only used with --allow-cycles)',
     )
     parser.add_argument(
         '--damping',
+        type=float,
         default=0.5,
         help='Damping factor for PageRank',
     )
     parser.add_argument(
         '--epsilon',
+        type=float,
         default=1e-13,
-        help='Convergence tolerance for PageRank',
+        help='Convergence tolerance for PageRank power iteration (only used with --allow-cycles)',
+    )
+    parser.add_argument(
+        '--float32',
+        action='store_true',
+        help=(
+            'Run PageRank in single precision. With --allow-cycles the power '
+            'iteration then needs an epsilon of ~1e-6 or larger'
+        ),
+    )
+    parser.add_argument(
+        '--allow-cycles',
+        action='store_true',
+        help=(
+            'Run PageRank by power iteration if the graph is not a DAG, '
+            'instead of stopping'
+        ),
     )
     parser.add_argument(
         '--out-degree',
@@ -71,6 +90,12 @@ def parse_args():
         default=None,
         help='Cutoff date for filtering data',
     )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Seed for the random day/month given to partial publication dates',
+    )
     parser.add_argument(
         '--info-prefix',
         default='dimensions_2025_05/publications/output/*/publications/*.parquet',
@@ -130,8 +155,12 @@ def parse_args():
 
 
 def save_to_s3(df, path):
-    df = df.to_pandas()
-    wr.s3.to_parquet(df=df, path=path, dataset=False)
+    # polars writes parquet straight to object storage, no pandas copy.
+    # LazyFrames are streamed to the file without being collected first.
+    if isinstance(df, pl.LazyFrame):
+        df.sink_parquet(path)
+    else:
+        df.write_parquet(path)
 
 
 def clean_df(df):
@@ -192,6 +221,7 @@ def main(args):
         info_date_field=args.info_date_field,
         info_publication_type_field=args.info_publication_type_field,
         publication_type_value=args.publication_type_value,
+        seed=args.seed,
     )
     df, info_df = load_data(handler, args.resume_locally)
 
@@ -200,6 +230,8 @@ def main(args):
         iterations=args.iterations,
         damping=args.damping,
         epsilon=args.epsilon,
+        dtype=np.float32 if args.float32 else np.float64,
+        allow_cycles=args.allow_cycles,
     )
     df = pagerank_processor.process_pagerank()
     if df is not None:
@@ -216,8 +248,7 @@ def main(args):
         )
         df = normaliser.process_normalisation()
         save_to_s3(df, full_output_path)
-        df_clean = clean_df(df)
-        save_to_s3(df_clean, clean_output_path)
+        save_to_s3(clean_df(df.lazy()), clean_output_path)
     else:
         save_to_s3(df, non_norm_output_path)
 